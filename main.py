@@ -4,6 +4,10 @@
 import os
 import sys
 import re
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Dict, List, Optional
 
 from telegram import (
@@ -309,6 +313,250 @@ async def show_menu(update: Update, text: str = "Выбирай 👇") -> None:
     await update.message.reply_text(text, reply_markup=MAIN_MENU_KB)
 
 
+# -------------------------
+# Статистика воронки (/stats)
+# -------------------------
+
+STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stats.json")
+STATS_BUCKET_SECONDS = 5 * 60
+STATS_CHECKPOINT_SECONDS = 60
+
+# Один поток на запись: чекпоинты пишутся строго по очереди и не блокируют event loop.
+STATS_WRITER = ThreadPoolExecutor(max_workers=1)
+
+STATS_WINDOWS: List[Tuple[str, int]] = [
+    ("1ч", 60 * 60),
+    ("24ч", 24 * 60 * 60),
+    ("7д", 7 * 24 * 60 * 60),
+]
+
+STATS_FLOWS: List[Tuple[str, str]] = [
+    ("flow:start", MENU_START),
+    ("flow:faq", MENU_FAQ),
+    ("flow:diag", MENU_DIAG),
+    ("flow:cases", MENU_CASES),
+    ("flow:pay", MENU_PAY),
+    ("flow:paid", MENU_PAID),
+    ("flow:human", MENU_HUMAN),
+]
+
+# Ключи, которые переезжают вместе с когортой: повторное «Оплатить» после оплаты
+# переносит и конверсию, иначе она осталась бы в корзине старого нажатия.
+STATS_COHORT_FOLLOWERS: Dict[str, List[str]] = {
+    "flow:pay": ["conv:paid_after_pay"],
+}
+
+
+class FunnelStats:
+    """Счётчики по 5-минутным корзинам: запись O(1), ответ /stats — сумма корзин за окно.
+
+    hit() считает события, seen() — уникальных пользователей: для каждого ключа
+    помним корзину последнего визита пользователя и при повторе переносим его
+    из старой корзины в новую, так что сумма корзин за окно = уникальные за окно.
+
+    seen_in_cohort() кладёт пользователя не в текущую корзину, а в корзину его
+    визита по ключу-когорте (например, «Оплатить»). Тогда за любое окно
+    шаг воронки ≤ когорта, и доля конверсии не уходит выше 100%.
+    Ключи из STATS_COHORT_FOLLOWERS при повторном визите переезжают вместе с когортой.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, Dict[int, int]] = {}
+        self.last_seen: Dict[str, Dict[int, int]] = {}
+        self.last_checkpoint = time.time()
+
+    @staticmethod
+    def bucket(now: float) -> int:
+        return int(now // STATS_BUCKET_SECONDS)
+
+    def hit(self, key: str, now: float) -> None:
+        counts = self.counts.setdefault(key, {})
+        b = self.bucket(now)
+        counts[b] = counts.get(b, 0) + 1
+
+    def seen(self, key: str, user_id: int, now: float) -> None:
+        b = self.bucket(now)
+        self._move(key, user_id, b)
+        for follower in STATS_COHORT_FOLLOWERS.get(key, []):
+            if user_id in self.last_seen.get(follower, {}):
+                self._move(follower, user_id, b)
+
+    def seen_in_cohort(self, key: str, user_id: int, cohort_key: str) -> bool:
+        b = self.last_seen.get(cohort_key, {}).get(user_id)
+        if b is None:
+            return False
+        self._move(key, user_id, b)
+        return True
+
+    def _move(self, key: str, user_id: int, b: int) -> None:
+        users = self.last_seen.setdefault(key, {})
+        prev = users.get(user_id)
+        if prev == b:
+            return
+
+        counts = self.counts.setdefault(key, {})
+        if prev is not None and prev in counts:
+            counts[prev] -= 1
+            if counts[prev] <= 0:
+                del counts[prev]
+
+        users[user_id] = b
+        counts[b] = counts.get(b, 0) + 1
+
+    def total(self, key: str, window_seconds: int, now: float) -> int:
+        counts = self.counts.get(key)
+        if not counts:
+            return 0
+        oldest = self.oldest_bucket(window_seconds, now)
+        return sum(c for b, c in counts.items() if b >= oldest)
+
+    def oldest_bucket(self, window_seconds: int, now: float) -> int:
+        # Текущая корзина неполная, поэтому берём на одну больше: окно покрывает
+        # не меньше window_seconds (и не больше на одну корзину).
+        return self.bucket(now) - window_seconds // STATS_BUCKET_SECONDS
+
+    def prune(self, now: float) -> None:
+        oldest = self.oldest_bucket(STATS_WINDOWS[-1][1], now)
+
+        for key in list(self.counts):
+            counts = {b: c for b, c in self.counts[key].items() if b >= oldest}
+            if counts:
+                self.counts[key] = counts
+            else:
+                del self.counts[key]
+
+        for key in list(self.last_seen):
+            users = {u: b for u, b in self.last_seen[key].items() if b >= oldest}
+            if users:
+                self.last_seen[key] = users
+            else:
+                del self.last_seen[key]
+
+    def snapshot(self, now: float) -> dict:
+        self.prune(now)
+        return {
+            "counts": {k: {str(b): c for b, c in v.items()} for k, v in self.counts.items()},
+            "last_seen": {k: {str(u): b for u, b in v.items()} for k, v in self.last_seen.items()},
+        }
+
+    @staticmethod
+    def write(path: str, data: dict) -> None:
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Ошибка записи статистики: {e}")
+
+    async def save(self, path: str) -> None:
+        now = time.time()
+        self.last_checkpoint = now
+        data = self.snapshot(now)
+        await asyncio.get_running_loop().run_in_executor(STATS_WRITER, self.write, path, data)
+
+    def checkpoint_due(self, now: float) -> bool:
+        return now - self.last_checkpoint >= STATS_CHECKPOINT_SECONDS
+
+    @classmethod
+    def load(cls, path: str) -> "FunnelStats":
+        stats = cls()
+        if not os.path.exists(path):
+            return stats
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            stats.counts = {
+                k: {int(b): int(c) for b, c in v.items()} for k, v in data.get("counts", {}).items()
+            }
+            stats.last_seen = {
+                k: {int(u): int(b) for u, b in v.items()} for k, v in data.get("last_seen", {}).items()
+            }
+        except Exception as e:
+            # Битый чекпоинт откладываем в .bad, иначе следующий чекпоинт затрёт его.
+            print(f"Ошибка чтения статистики, сохраняю файл как {path}.bad и начинаю с нуля: {e}")
+            try:
+                os.replace(path, path + ".bad")
+            except OSError as move_error:
+                print(f"Не удалось сохранить {path}.bad: {move_error}")
+            return cls()
+        stats.prune(time.time())
+        return stats
+
+
+def track(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, unique: bool = True) -> None:
+    stats: Optional[FunnelStats] = context.application.bot_data.get("STATS")
+    if stats is None:
+        return
+
+    now = time.time()
+    if unique:
+        tg_user_id, _ = user_identity(update)
+        stats.seen(key, tg_user_id, now)
+    else:
+        stats.hit(key, now)
+    schedule_checkpoint(context, stats, now)
+
+
+def track_cohort(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, cohort_key: str) -> None:
+    stats: Optional[FunnelStats] = context.application.bot_data.get("STATS")
+    if stats is None:
+        return
+
+    tg_user_id, _ = user_identity(update)
+    stats.seen_in_cohort(key, tg_user_id, cohort_key)
+    schedule_checkpoint(context, stats, time.time())
+
+
+def schedule_checkpoint(context: ContextTypes.DEFAULT_TYPE, stats: FunnelStats, now: float) -> None:
+    if not stats.checkpoint_due(now):
+        return
+    # Сразу сдвигаем отметку, чтобы соседние апдейты не запланировали второй чекпоинт.
+    stats.last_checkpoint = now
+    context.application.create_task(stats.save(STATS_PATH))
+
+
+def percent(part: int, whole: int) -> str:
+    return f"{round(100 * part / whole)}%" if whole else "—"
+
+
+def format_stats(stats: FunnelStats, now: float) -> str:
+    def by_windows(key: str) -> str:
+        return " / ".join(str(stats.total(key, seconds, now)) for _, seconds in STATS_WINDOWS)
+
+    lines = [
+        "📊 Статистика ({})".format(" / ".join(name for name, _ in STATS_WINDOWS)),
+        "",
+        "👥 Уникальные пользователи по разделам:",
+    ]
+    lines += [f"• {title}: {by_windows(key)}" for key, title in STATS_FLOWS]
+
+    lines += ["", "🎥 FAQ (просмотры ответов):"]
+    lines += [f"• {q}: {by_windows('faq:' + q)}" for q in FAQ_TEXTS]
+
+    lines += ["", f"🔎 Диагностика — {DIAG_Q1_TEXT}"]
+    lines += [f"• {a}: {by_windows('diag_q1:' + a)}" for a in (DIAG_Q1_A, DIAG_Q1_B)]
+    lines += ["", f"🔎 Диагностика — {DIAG_Q2_TEXT}"]
+    lines += [f"• {a}: {by_windows('diag_q2:' + a)}" for a in (DIAG_Q2_A, DIAG_Q2_B, DIAG_Q2_C)]
+
+    lines += ["", "📌 Кейсы (начавшие в окне: дошли до каждого шага, % дочитавших):"]
+    for case_name, steps in CASES_STEPS.items():
+        lines.append(f"• {case_name}")
+        for name, seconds in STATS_WINDOWS:
+            reached = [stats.total(f"case:{case_name}:{i}", seconds, now) for i in range(len(steps))]
+            chain = " → ".join(str(n) for n in reached)
+            lines.append(f"  {name}: {chain} ({percent(reached[-1], reached[0])})")
+
+    lines += ["", "💳 Оплатить → Я оплатила (нажавшие «Оплатить» в окне):"]
+    for name, seconds in STATS_WINDOWS:
+        pay = stats.total("flow:pay", seconds, now)
+        converted = stats.total("conv:paid_after_pay", seconds, now)
+        lines.append(f"• {name}: {converted}/{pay} ({percent(converted, pay)})")
+    lines.append(f"• Всего нажатий «Я оплатила»: {by_windows('paid:presses')}")
+
+    return "\n".join(lines)
+
+
 # -------------------------
 # Команды
 # -------------------------
@@ -322,6 +570,13 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats: Optional[FunnelStats] = context.application.bot_data.get("STATS")
+    if stats is None:
+        return
+    await update.message.reply_text(format_stats(stats, time.time()))
+
+
 async def menu_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await show_menu(update)
     return ConversationHandler.END
@@ -334,6 +589,7 @@ async def menu_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 VIDEOS_STATE = 11
 
 async def videos_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    track(update, context, "flow:start")
     await update.message.reply_text(VIDEOS_INTRO, reply_markup=VIDEOS_MENU_KB)
     return VIDEOS_STATE
 
@@ -363,6 +619,7 @@ async def videos_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 FAQ_STATE = 10
 
 async def faq_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    track(update, context, "flow:faq")
     await update.message.reply_text(FAQ_INTRO, reply_markup=FAQ_MENU_KB)
     return FAQ_STATE
 
@@ -379,6 +636,8 @@ async def faq_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Выбери вопрос кнопкой 👇", reply_markup=FAQ_MENU_KB)
         return FAQ_STATE
 
+    track(update, context, "faq:" + text, unique=False)
+
     answer_with_links = answer + faq_links_as_text(text)
     inline_kb = faq_inline_buttons_for(text)
 
@@ -392,6 +651,7 @@ async def faq_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # -------------------------
 
 async def diag_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    track(update, context, "flow:diag")
     context.user_data.pop("diag_blog", None)
     context.user_data.pop("diag_goal", None)
 
@@ -410,6 +670,7 @@ async def diag_q1(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return DIAG_Q1
 
     context.user_data["diag_blog"] = text
+    track(update, context, "diag_q1:" + text)
     await update.message.reply_text(DIAG_Q2_TEXT, reply_markup=DIAG_Q2_KB)
     return DIAG_Q2
 
@@ -424,6 +685,7 @@ async def diag_q2(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Выбери вариант кнопкой 👇", reply_markup=DIAG_Q2_KB)
         return DIAG_Q2
 
+    track(update, context, "diag_q2:" + text)
     await update.message.reply_text(
         "✅ *Подойдёт ли тебе это?*\n\nДержи 3 статьи — по делу 👇",
         reply_markup=DIAG_ARTICLES_KB,
@@ -438,6 +700,7 @@ async def diag_q2(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # -------------------------
 
 async def cases_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    track(update, context, "flow:cases")
     await update.message.reply_text("📌 Выбирай кейс 👇", reply_markup=CASES_MENU_KB)
     return CASE_STATE
 
@@ -460,6 +723,7 @@ async def cases_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     if text in CASES_STEPS:
         context.user_data["case_name"] = text
         context.user_data["case_step"] = 0
+        track(update, context, f"case:{text}:0")
         await update.message.reply_text(CASES_STEPS[text][0], reply_markup=CASE_KB, parse_mode="Markdown")
         return CASE_STATE
 
@@ -477,6 +741,7 @@ async def cases_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             await show_menu(update, "Возвращаю в меню.")
             return ConversationHandler.END
 
+        track_cohort(update, context, f"case:{case_name}:{idx}", f"case:{case_name}:0")
         await update.message.reply_text(steps[idx], reply_markup=CASE_KB, parse_mode="Markdown")
         return CASE_STATE
 
@@ -489,6 +754,7 @@ async def cases_handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 # -------------------------
 
 async def pay_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    track(update, context, "flow:pay")
     inline = InlineKeyboardMarkup([
         [InlineKeyboardButton("💳 Перейти к оплате", url=PAY_URL)],
     ])
@@ -507,6 +773,9 @@ async def pay_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def paid_notify(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    track(update, context, "flow:paid")
+    track(update, context, "paid:presses", unique=False)
+    track_cohort(update, context, "conv:paid_after_pay", "flow:pay")
     inline = InlineKeyboardMarkup([
         [InlineKeyboardButton("🎓 Войти в чат мини-курса", url=MINI_COURSE_CHAT_URL)],
     ])
@@ -544,6 +813,7 @@ async def paid_notify(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 # -------------------------
 
 async def call_human(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    track(update, context, "flow:human")
     await update.message.reply_text(
         "Ок. Человека позвала.",
         reply_markup=MAIN_MENU_KB,
@@ -610,13 +880,21 @@ async def menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 # main
 # -------------------------
 
+async def save_stats_on_shutdown(app: Application) -> None:
+    stats: Optional[FunnelStats] = app.bot_data.get("STATS")
+    if stats is not None:
+        await stats.save(STATS_PATH)
+
+
 def main() -> None:
     token, admin_chat_id = require_env_vars()
 
-    app = Application.builder().token(token).build()
+    app = Application.builder().token(token).post_shutdown(save_stats_on_shutdown).build()
     app.bot_data["ADMIN_CHAT_ID"] = admin_chat_id
+    app.bot_data["STATS"] = FunnelStats.load(STATS_PATH)
 
     app.add_handler(CommandHandler("start", cmd_start))
+    app.add_handler(CommandHandler("stats", cmd_stats, filters=filters.Chat(chat_id=admin_chat_id)))
 
     videos_conv = ConversationHandler(
         entry_points=[MessageHandler(filters.Regex(r"^{}$".format(re.escape(MENU_START))), videos_entry)],